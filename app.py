@@ -1,17 +1,41 @@
 # Realty Companion Pro – Chicago Edition
 # © 2025 Brian James Chapman. All Rights Reserved.
 # Licensed under the MIT License – see LICENSE file for details.
-import html, json
+import html, io, json
 import pandas as pd, streamlit as st
-from jsonschema import validate, ValidationError
+from jsonschema import validators
+from jsonschema.exceptions import best_match
 from pathlib import Path
-from engine import load_json, run_all
+from engine import headwind_table, load_json, run_all
 
 st.set_page_config(page_title='Realty Companion Pro – Chicago Edition', page_icon='📈', layout='centered')
 st.title('Realty Companion Pro – Chicago Edition')
 st.caption('Novice-first flip evaluator with auto-tuned Monte Carlo (Engineer vs Consumer lenses).')
 
-regional_map = load_json('data/regional_headwinds.json', {})
+REGIONAL_PATH = 'data/regional_headwinds.json'
+
+def _mtime(p):
+    try:
+        return Path(p).stat().st_mtime
+    except OSError:
+        return None
+
+@st.cache_resource
+def _load_regional(path, mtime):
+    m = load_json(path, {})
+    return m, (headwind_table(m) if m.get('rings') else None)
+
+@st.cache_data(show_spinner=False)
+def _cached_run_all(inp_items, sims, regional_key):
+    return run_all(pd.DataFrame([dict(inp_items)]), regional_map, sims=sims, autotune=True, hi_map=hi_map)
+
+@st.cache_data(show_spinner=False)
+def _csv_bytes(df):
+    buf = io.BytesIO(); df.to_csv(buf, index=False, encoding='utf-8')
+    return buf.getvalue()
+
+regional_key = _mtime(REGIONAL_PATH)
+regional_map, hi_map = _load_regional(REGIONAL_PATH, regional_key)
 schema = {
   "type":"object",
   "properties":{
@@ -30,6 +54,8 @@ schema = {
   },
   "required":["address","region_ring","purchase","rehab","carry","selling_pct","projected_sale","hold_months","permit_delay_days","tax_drag","ltv","loan_rate_annual"]
 }
+_Validator = validators.validator_for(schema); _Validator.check_schema(schema)
+deal_validator = _Validator(schema)
 
 with st.expander('Quick guide', expanded=True):
     st.markdown('- Enter deal → Run simulations → Read GO/CAUTION.\n- Bars auto-tune each run. CSV exports included.')
@@ -61,22 +87,20 @@ if submitted:
       'hold_months': float(hold_months), 'permit_delay_days': int(permit_days),
       'tax_drag': float(tax_drag), 'ltv': 0.80, 'loan_rate_annual': 0.085
     }
-    try:
-        validate(inp, schema)
-    except ValidationError as e:
-        st.error(f'Input error: {e.message}'); st.stop()
-    df = pd.DataFrame([inp])
+    err = best_match(deal_validator.iter_errors(inp))
+    if err is not None:
+        st.error(f'Input error: {err.message}'); st.stop()
     sims = 10000 if sims_mode.startswith('Quick') else 100000 if sims_mode.startswith('Full') else 200000
 
     with st.spinner('Simulating and auto-tuning…'):
-        results, summaries, opps = run_all(df, regional_map, sims=sims, autotune=True)
+        results, summaries, opps = _cached_run_all(tuple(sorted(inp.items())), sims, regional_key)
 
     st.subheader('Decision bars (auto-tuned)'); st.json(summaries.get('bars', {}))
     st.subheader('Lens summaries'); st.json({'Engineer': summaries['Engineer'], 'Consumer': summaries['Consumer']})
     st.subheader('Opportunities (ranked)'); st.dataframe(opps, use_container_width=True)
-    st.download_button('Download Opportunities CSV', data=opps.to_csv(index=False).encode('utf-8'), file_name='monetization_opportunities.csv', use_container_width=True)
+    st.download_button('Download Opportunities CSV', data=_csv_bytes(opps), file_name='monetization_opportunities.csv', use_container_width=True)
     st.subheader('All results'); st.dataframe(results, use_container_width=True)
-    st.download_button('Download All Results CSV', data=results.to_csv(index=False).encode('utf-8'), file_name='flip_results.csv', use_container_width=True)
+    st.download_button('Download All Results CSV', data=_csv_bytes(results), file_name='flip_results.csv', use_container_width=True)
 
     st.header('3) ChatGPT Handoff (free)')
     base_prompt = (
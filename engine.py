@@ -2,7 +2,9 @@
 # © 2025 Brian James Chapman. All Rights Reserved.
 # Licensed under the MIT License – see LICENSE file for details.
 import json
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np, pandas as pd
+from numpy.random import Generator, SFC64
 from pathlib import Path
 
 def load_json(p, default):
@@ -18,48 +20,73 @@ def headwind_index(region, regional_map):
     hi=100.0*(0.30*inv_n+0.25*dom_n+0.20*(1.0-ls)+0.15*tax_n+0.10*permit_n)
     return float(np.clip(hi,0.0,100.0))
 
-def gaussian_copula_normals(rng, n, R):
-    Z = rng.standard_normal((n,R.shape[0]))
-    L = np.linalg.cholesky(R + 1e-12*np.eye(R.shape[0]))
-    return Z @ L.T
+def headwind_table(regional_map):
+    return {ring: headwind_index(ring, regional_map) for ring in regional_map['rings']}
 
-def cvar5_empirical(roi):
-    p5 = np.percentile(roi,5)
-    tail = roi[roi<=p5]
-    return float(tail.mean()) if tail.size>0 else float(p5)
+_R = np.array([[1.0,-0.35,0.20],[-0.35,1.0,0.15],[0.20,0.15,1.0]])
+_L_T = np.linalg.cholesky(_R + 1e-12*np.eye(3)).T.astype(np.float32)
 
-def simulate_once(df, regional_map, sims, lens, rng=None):
-    if rng is None: rng=np.random.default_rng()
-    rows=[]
-    R=np.array([[1.0,-0.35,0.20],[-0.35,1.0,0.15],[0.20,0.15,1.0]])
-    Z=gaussian_copula_normals(rng,sims,R)
-    regimes=np.array([0.2,0.6,0.2]) if lens=='Engineer' else np.array([0.15,0.6,0.25])
-    idx=rng.choice([0,1,2],size=sims,p=regimes)
-    arv_shift=np.array([-0.03,0.0,0.02])[idx]
-    hold_shift=np.array([0.6,0.0,-0.3])[idx]
-    rehab_sd,arv_sd,hold_sd=(0.30,0.15,1.40) if lens=='Engineer' else (0.15,0.08,0.70)
+def gaussian_copula_normals(rng, n, R=None, out=None):
+    if R is None: L_T = _L_T
+    else: L_T = np.linalg.cholesky(R + 1e-12*np.eye(R.shape[0])).T.astype(np.float32)
+    Z = rng.standard_normal((n,L_T.shape[0]), dtype=np.float32, out=out)
+    return np.matmul(Z, L_T, out=out)
 
-    for _,r in df.iterrows():
-        region=str(r['region_ring']); hi=headwind_index(region,regional_map)
-        purchase=float(r['purchase']); rehab=float(r['rehab']); carry=float(r['carry']); selling=float(r['selling_pct']); arv=float(r['projected_sale'])
-        hold_m=float(r.get('hold_months',4)); permit=float(r.get('permit_delay_days',0)); tax=float(r.get('tax_drag',0.02))
-        ltv=float(r.get('ltv',0.8)); rate=float(r.get('loan_rate_annual',0.085))
-        z_arv,z_hold,z_rehab=Z[:,0],Z[:,1],Z[:,2]
-        rehab_draw=np.exp(np.log(max(rehab,1.0))+rehab_sd*z_rehab)
-        sale_draw=np.clip(arv*(1.0+arv_sd*z_arv+arv_shift),0.5*purchase,None)
-        hold_draw=np.clip(hold_m+permit/30.0+hold_sd*z_hold+hold_shift,1.0,None)
-        loan_amt=ltv*purchase; interest_cost=loan_amt*rate*(hold_draw/12.0)
-        sell_cost=np.clip(selling,0.0,0.12)*sale_draw; carry_total=(carry/max(1.0,hold_m))*hold_draw
-        tax_drag_amt=tax*purchase*(hold_draw/12.0)
-        tpc=purchase+rehab_draw+carry_total+interest_cost+tax_drag_amt+sell_cost
-        roi=(sale_draw-tpc)/tpc
-        p_loss=float((roi<0).mean()); p5,p10,p50,p90=np.percentile(roi,[5,10,50,90]); cvar5=cvar5_empirical(roi)
-        risk_adj=(1.0-hi/100.0)*p50
-        rows.append({'address':r['address'],'region_ring':region,'HI':round(hi,1),
-                     'P10_ROI%':round(100*p10,2),'P50_ROI%':round(100*p50,2),'P90_ROI%':round(100*p90,2),
-                     'VaR5_ROI%':round(100*p5,2),'CVaR5_ROI%':round(100*cvar5,2),'P(loss)%':round(100*p_loss,2),
-                     'Risk-Adj ROI P50%':round(100*risk_adj,2)})
-    return pd.DataFrame(rows)
+def roi_stats(roi):
+    # Cascaded O(n) partitions along the sims axis serve P5/P10/P50/P90 and the CVaR5 tail;
+    # each later pass only touches the slice left over by the previous one.
+    n = roi.shape[-1]; k5,k10,k50,k90 = (int(q*n) for q in (0.05,0.10,0.50,0.90))
+    part = np.partition(roi,k50,axis=-1)
+    part[...,k50+1:].partition(k90-k50-1,axis=-1)
+    part[...,:k50].partition(k10,axis=-1)
+    part[...,:k10].partition(k5,axis=-1)
+    # P(loss): segments bounded by the pivots are all-negative or all-non-negative unless they straddle 0.
+    edges = (0,k5,k10,k50,k90,n); nloss = np.zeros(roi.shape[:-1])
+    for lo,hi in zip(edges,edges[1:]):
+        if hi<n and (part[...,hi]<0).all(): nloss += hi-lo
+        elif not (lo>0 and (part[...,lo]>=0).all()): nloss += np.count_nonzero(part[...,lo:hi]<0,axis=-1)
+    return part[...,k5], part[...,k10], part[...,k50], part[...,k90], part[...,:k5+1].mean(axis=-1,dtype=np.float64), nloss/n
+
+def simulate_all(df, regional_map, sims, rng=None, hi_map=None):
+    if rng is None: rng=Generator(SFC64())
+    if hi_map is None: hi_map=headwind_table(regional_map)
+    lenses=np.array(['Engineer','Consumer'])
+    Z=gaussian_copula_normals(rng,2*sims,out=np.empty((2*sims,3),dtype=np.float32)).reshape(2,1,sims,3)
+    regimes=np.array([[0.2,0.6,0.2],[0.15,0.6,0.25]])
+    sizes=(sims*regimes).astype(int); sizes[:,-1]=sims-sizes[:,:-1].sum(axis=1)
+    arv_shift=np.stack([np.repeat(np.float32([-0.03,0.0,0.02]),n) for n in sizes])[:,None,:]
+    hold_shift=np.stack([np.repeat(np.float32([0.6,0.0,-0.3]),n) for n in sizes])[:,None,:]
+    rehab_sd,arv_sd,hold_sd=(np.float32(v).reshape(2,1,1) for v in ((0.30,0.15),(0.15,0.08),(1.40,0.70)))
+
+    def col(c, default=None):
+        v=df[c].to_numpy(np.float32) if c in df else np.full(len(df),default,dtype=np.float32)
+        return v[:,None]
+    region=df['region_ring'].astype(str); hi=region.map(hi_map).fillna(next(iter(hi_map.values()))).to_numpy(float); region=region.to_numpy()
+    purchase=col('purchase'); rehab=col('rehab'); carry=col('carry'); selling=col('selling_pct'); arv=col('projected_sale')
+    hold_m=col('hold_months',4); permit=col('permit_delay_days',0); tax=col('tax_drag',0.02)
+    ltv=col('ltv',0.8); rate=col('loan_rate_annual',0.085)
+    z_arv,z_hold,z_rehab=Z[...,0],Z[...,1],Z[...,2]
+    hold_coef=ltv*purchase*rate/12.0+carry/np.maximum(1.0,hold_m)+tax*purchase/12.0
+    sale_draw,hold_draw,tpc=(np.empty((2,len(df),sims),dtype=np.float32) for _ in range(3))
+
+    def lens_stats(k):
+        sale,hold,cost=sale_draw[k],hold_draw[k],tpc[k]
+        np.multiply(rehab_sd[k],z_rehab[k],out=cost); cost+=np.log(np.maximum(rehab,1.0)); np.exp(cost,out=cost); cost+=purchase
+        np.multiply(hold_sd[k],z_hold[k],out=hold); hold+=hold_shift[k]; hold+=hold_m+permit/30.0; np.clip(hold,1.0,None,out=hold)
+        hold*=hold_coef; cost+=hold
+        np.multiply(arv_sd[k],z_arv[k],out=sale); sale+=arv_shift[k]; sale+=1.0; sale*=arv; np.clip(sale,0.5*purchase,None,out=sale)
+        np.multiply(sale,np.clip(selling,0.0,0.12),out=hold); cost+=hold
+        roi=np.divide(sale,cost,out=sale); roi-=1.0
+        return roi_stats(roi)
+    # NumPy releases the GIL inside these ufuncs/partitions, so the two lenses run concurrently.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        p5,p10,p50,p90,cvar5,p_loss=(np.stack(v) for v in zip(*ex.map(lens_stats,range(2))))
+    risk_adj=(1.0-hi/100.0)*p50
+    n=len(df); pct=lambda x: np.round(100*x.ravel().astype(np.float64),2)
+    return pd.DataFrame({'address':np.tile(df['address'].to_numpy(),2),'region_ring':np.tile(region,2),'HI':np.tile(np.round(hi,1),2),
+                         'P10_ROI%':pct(p10),'P50_ROI%':pct(p50),'P90_ROI%':pct(p90),
+                         'VaR5_ROI%':pct(p5),'CVaR5_ROI%':pct(cvar5),'P(loss)%':pct(p_loss),
+                         'Risk-Adj ROI P50%':pct(risk_adj),'lens':np.repeat(lenses,n)})
 
 def decide(df,bars=None):
     if bars is None: bars={'risk_adj':8.5,'ploss':15.0,'cvar':-10.0}
@@ -68,42 +95,46 @@ def decide(df,bars=None):
 
 def autotune_bars(cons_df, cons_sum, opp_df, opp_sum, defaults={'risk_adj':8.5,'ploss':15.0,'cvar':-10.0}):
     cand_r=np.arange(6.0,12.5,0.5); cand_p=np.arange(10.0,25.5,0.5); cand_c=np.arange(-20.0,-5.0,1.0)
-    def go_rate(df,b):
-        return float(((df['Risk-Adj ROI P50%']>=b['risk_adj']) & (df['P(loss)%']<=b['ploss']) & (df['CVaR5_ROI%']>b['cvar'])).mean())
-    best=defaults; best_score=-1
-    for rr in cand_r:
-        for pp in cand_p:
-            for cc in cand_c:
-                b={'risk_adj':float(rr),'ploss':float(pp),'cvar':float(cc)}
-                ge=go_rate(cons_df,b); gc=go_rate(opp_df,b)
-                pen = 0.0 if ge<=0.15 else -5.0*(ge-0.15)
-                reward = 1.0 - abs(gc-0.33)
-                safety = (cc+20.0)/10.0
-                score = reward + safety + pen
-                if score>best_score:
-                    best_score=score; best=b
-    return best
+    def go_rate(df):
+        # Each bar is a per-axis mask, so the GO count over the whole grid is one (r*p, n) @ (n, c) product.
+        ra=df['Risk-Adj ROI P50%'].to_numpy(float); pl=df['P(loss)%'].to_numpy(float); cv=df['CVaR5_ROI%'].to_numpy(float)
+        mr=(ra>=cand_r[:,None]).astype(float); mp=(pl<=cand_p[:,None]).astype(float); mc=(cv>cand_c[:,None]).astype(float)
+        return ((mr[:,None,:]*mp[None,:,:]).reshape(-1,ra.size)@mc.T).reshape(cand_r.size,cand_p.size,cand_c.size)/ra.size
+    ge=go_rate(cons_df); gc=go_rate(opp_df)
+    pen=np.where(ge<=0.15,0.0,-5.0*(ge-0.15))
+    reward=1.0-np.abs(gc-0.33)
+    safety=(cand_c[None,None,:]+20.0)/10.0
+    score=reward+safety+pen
+    i=int(np.argmax(score))
+    if score.flat[i]<=-1: return defaults
+    ir,ip,ic=np.unravel_index(i,score.shape)
+    return {'risk_adj':float(cand_r[ir]),'ploss':float(cand_p[ip]),'cvar':float(cand_c[ic])}
 
-def run_all(df, regional_map, sims=200000, bars=None, autotune=True, save_path='data/auto_tune.json'):
-    eng=simulate_once(df, regional_map, sims=sims, lens='Engineer'); eng['lens']='Engineer'
-    con=simulate_once(df, regional_map, sims=sims, lens='Consumer'); con['lens']='Consumer'
-    both=pd.concat([eng,con], ignore_index=True)
+def run_all(df, regional_map, sims=200000, bars=None, autotune=True, save_path='data/auto_tune.json', hi_map=None, seed=0):
+    if hi_map is None: hi_map=headwind_table(regional_map)
+    both=simulate_all(df, regional_map, sims=sims, rng=Generator(SFC64(seed)), hi_map=hi_map)
+    eng=both[both['lens']=='Engineer']; con=both[both['lens']=='Consumer']
     defaults={'risk_adj':8.5,'ploss':15.0,'cvar':-10.0}
     if bars is None: bars=defaults
-    sums={'Engineer':decide(eng,bars),'Consumer':decide(con,bars),'bars':bars}
     if autotune:
-        tuned=autotune_bars(eng, sums['Engineer'], con, sums['Consumer'], defaults)
+        tuned=autotune_bars(eng, None, con, None, defaults)
         sums={'Engineer':decide(eng,tuned),'Consumer':decide(con,tuned),'bars':tuned,'defaults':defaults}
         try:
             Path(save_path).parent.mkdir(parents=True, exist_ok=True)
             Path(save_path).write_text(json.dumps(tuned, indent=2))
         except Exception:
             pass
-    grp=both.groupby(['region_ring','lens'], as_index=False).median(numeric_only=True)
-    rows=[]; b=sums['bars']
-    for _,row in grp.iterrows():
-        status='GO' if (row['Risk-Adj ROI P50%']>=b['risk_adj'] and row['P(loss)%']<=b['ploss'] and row['CVaR5_ROI%']>b['cvar']) else 'CAUTION'
-        nudge='Pursue comps & financing quotes now' if status=='GO' else 'Renegotiate price 5–10% or trim rehab 10–15%'
-        rows.append({'region':row['region_ring'],'lens':row['lens'],'RiskAdj%':row['Risk-Adj ROI P50%'],'Ploss%':row['P(loss)%'],'CVaR5%':row['CVaR5_ROI%'],'status':status,'nudge':nudge})
-    opps=pd.DataFrame(rows).sort_values(['status','RiskAdj%'], ascending=[True,False])
+    else:
+        sums={'Engineer':decide(eng,bars),'Consumer':decide(con,bars),'bars':bars}
+    r_uni,r_idx=np.unique(both['region_ring'].to_numpy(str),return_inverse=True)
+    l_uni,l_idx=np.unique(both['lens'].to_numpy(str),return_inverse=True)
+    key=r_idx*len(l_uni)+l_idx; order=np.argsort(key,kind='stable'); key=key[order]
+    vals=both[['Risk-Adj ROI P50%','P(loss)%','CVaR5_ROI%']].to_numpy(float)[order]
+    starts=np.flatnonzero(np.r_[True,key[1:]!=key[:-1]]); ends=np.r_[starts[1:],key.size]
+    meds=np.array([np.median(vals[s0:s1],axis=0) for s0,s1 in zip(starts,ends)]).reshape(-1,3)
+    ra,pl,cv=meds.T; gkey=key[starts]; b=sums['bars']
+    go=(ra>=b['risk_adj']) & (pl<=b['ploss']) & (cv>b['cvar'])
+    opps=pd.DataFrame({'region':r_uni[gkey//len(l_uni)],'lens':l_uni[gkey%len(l_uni)],'RiskAdj%':ra,'Ploss%':pl,'CVaR5%':cv,
+                       'status':np.where(go,'GO','CAUTION'),
+                       'nudge':np.where(go,'Pursue comps & financing quotes now','Renegotiate price 5–10% or trim rehab 10–15%')}).sort_values(['status','RiskAdj%'], ascending=[True,False])
     return both, sums, opps